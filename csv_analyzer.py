@@ -1,6 +1,18 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
+from io import BytesIO
+
+try:
+    import pyarrow  # noqa: F401
+    READ_CSV_OPTIONS = {"engine": "pyarrow", "dtype_backend": "pyarrow"}
+except ImportError:
+    READ_CSV_OPTIONS = {}
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def read_csv(data: bytes) -> pd.DataFrame:
+    # Ключ кэша — содержимое файла: на перерисовках CSV не парсится заново
+    return pd.read_csv(BytesIO(data), **READ_CSV_OPTIONS)
 
 st.title("Анализ CSV-файла 📈")
 
@@ -9,7 +21,7 @@ uploaded_file = st.file_uploader("Загрузите CSV-файл", type=["csv"]
 
 if uploaded_file is not None:
     # Читаем файл в DataFrame
-    df = pd.read_csv(uploaded_file)
+    df = read_csv(uploaded_file.getvalue())
     st.subheader("Первые 5 строк данных:")
     st.write(df.head())
 
@@ -18,13 +30,9 @@ if uploaded_file is not None:
     x_col = st.selectbox("Выберите колонку для X", columns)
     y_col = st.selectbox("Выберите колонку для Y", columns)
 
-    # Построение графика
+    # Построение графика (Vega-Lite на стороне браузера, без отрисовки PNG на сервере)
     st.subheader(f"График: {y_col} от {x_col}")
-    fig, ax = plt.subplots()
-    ax.plot(df[x_col], df[y_col])
-    ax.set_xlabel(x_col)
-    ax.set_ylabel(y_col)
-    ax.grid(True)
-    st.pyplot(fig)
+    chart_df = df[list(dict.fromkeys([x_col, y_col]))].dropna()
+    st.line_chart(chart_df[y_col].set_axis(chart_df[x_col]).sort_index())
 else:
     st.info("Пожалуйста, загрузите CSV-файл для начала анализа.")
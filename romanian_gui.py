@@ -1,29 +1,66 @@
 # === Импорты и базовая настройка ===
 import asyncio
+import atexit
 import csv
+import hashlib
 import os
+import re
+import threading
+import time
+import urllib.parse
 import zipfile
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import List, Dict, Iterator, NamedTuple
 import streamlit as st
 import streamlit.components.v1 as components
-from pydub import AudioSegment
-from googletrans import Translator
-from gtts import gTTS
+# pydub, googletrans и gTTS импортируются там, где нужны: холодный старт страницы без них быстрее
 from io import StringIO, BytesIO
 import base64
 from datetime import datetime
 import datetime as dt
 import pandas as pd
-from collections import Counter
+from collections import OrderedDict
+from functools import lru_cache
 import json
 from streamlit_autorefresh import st_autorefresh
 
+# Первой командой Streamlit: кэшированные ресурсы ниже вызываются ещё до интерфейса
+st.set_page_config(page_title="Romanian Transcriber", layout="wide")
+
 # === Пути к файлам и папкам ===
-CSV_CACHE_FILE = "transcription_cache.csv"
+CACHE_FILE = "transcription_cache.parquet"
+CSV_CACHE_FILE = "transcription_cache.csv"  # старый формат кэша, переносится в Parquet
 LAST_SESSION_FOLDER = "sessions"
 AUDIO_FOLDER = "audio_files"
-os.makedirs(AUDIO_FOLDER, exist_ok=True)
-os.makedirs(LAST_SESSION_FOLDER, exist_ok=True)
+TTS_WORKERS = 6  # один пул на процесс, общий для всех сессий: синтез, фоновая подгрузка и декодирование
+TTS_URL = "https://translate.google.com/_/TranslateWebserverUi/data/batchexecute"
+TTS_MAX_CHARS = 100  # длиннее gTTS режет текст на куски — такое отдаём ему
+CSV_CHUNK_ROWS = 50_000
+CARDS_PAGE_SIZE = 20
+CACHE_VACUUM_PARTS = 50
+# Сколько готовых склеек mix_*.mp3 держать на диске; старые по времени использования удаляются
+MIX_FILES_KEEP = 20
+TRANSLATE_CONCURRENCY = 8
+TRANSLATE_BATCH_CHARS = 4000
+# Сколько раз переспрашивать Google, пока пользователь ждёт результат, и потолок паузы между попытками (сек)
+TRANSLATE_ATTEMPTS = 5
+TRANSLATE_MAX_BACKOFF = 30
+RETRY_STATUS_RE = re.compile(r'status code "(429|5\d\d)"')
+TEXT_CACHE_SIZE = 4096
+TRANSLATIONS_FILE = "translations.json"
+TRANSLATION_CACHE_SIZE = 4096
+# mp3 в памяти: ~10–30 КБ на фразу, так что кэш держит десятки мегабайт, не больше
+TTS_CACHE_SIZE = 2000
+
+# === Колонки CSV и значения по умолчанию для старых файлов ===
+CSV_FIELDS = [
+    "original", "normalized", "ipa", "ru_phonetic", "translation",
+    "lang", "known", "category", "date_added", "date_known"
+]
+CSV_DEFAULTS = {
+    'normalized': '', 'lang': '',
+    'known': '❌', 'category': '', 'date_added': '', 'date_known': ''
+}
 
 # === Нормализация отдельных слов (при необходимости) ===
 NORMALIZATION_MAP = {
@@ -49,6 +86,36 @@ RU_REPLACEMENTS = [
     ('w', 'в'), ('x', 'кс'), ('y', 'и'), ('z', 'з')
 ]
 
+# === Предкомпилированные правила: один проход слева направо, на каждой позиции — самое длинное совпадение ===
+def compile_rules(rules: List[tuple]) -> tuple:
+    rules_map = dict(rules)
+    single = {orig: repl for orig, repl in rules_map.items() if len(orig) == 1}
+    multi = [orig for orig in rules_map if len(orig) > 1]
+    # Одиночные символы — вторым проходом через str.translate; это безопасно, только если
+    # замены многосимвольных правил не содержат символов-ключей, иначе всё идёт через регулярку
+    if any(ch in single for orig in multi for ch in rules_map[orig]):
+        single, multi = {}, list(rules_map)
+    # Длинные ключи первыми: альтернация re берёт первый подходящий вариант, так 'ce' всегда побеждает 'c'
+    keys = sorted(multi, key=len, reverse=True)
+    rules_regex = re.compile('|'.join(re.escape(orig) for orig in keys)) if keys else None
+    return rules_regex, rules_map, str.maketrans(single)
+
+class Setup(NamedTuple):
+    ipa_rules: tuple
+    ru_rules: tuple
+
+@st.cache_resource(show_spinner=False)
+def get_setup() -> Setup:
+    # Папки и компиляция правил — один раз на процесс, а не на каждом перезапуске скрипта
+    os.makedirs(AUDIO_FOLDER, exist_ok=True)
+    os.makedirs(LAST_SESSION_FOLDER, exist_ok=True)
+    return Setup(compile_rules(IPA_REPLACEMENTS), compile_rules(RU_REPLACEMENTS))
+
+IPA_RULES, RU_RULES = get_setup()
+NAMED_RULES = {'ipa': IPA_RULES, 'ru': RU_RULES}
+# Списки правил → имя готового набора (regex, map, table); выбор по идентичности списка, без перекомпиляции
+RULE_KINDS = {id(IPA_REPLACEMENTS): 'ipa', id(RU_REPLACEMENTS): 'ru'}
+
 # === Отображение флагов для языков ===
 LANG_FLAGS = {
     "ru": "🇷🇺 Русский",
@@ -56,113 +123,566 @@ LANG_FLAGS = {
     "ro": "🇷🇴 Румынский"
 }
 
-translator = Translator()
+# === Один тёплый Translator и один фоновый event loop на процесс ===
+@st.cache_resource(show_spinner=False)
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="async-loop", daemon=True).start()
+    return loop
+
+@st.cache_resource(show_spinner=False)
+def get_translator():
+    # httpx-клиент внутри живёт между перезапусками скрипта и переиспользует соединения
+    from googletrans import Translator
+    # С ошибкой, а не с исходным текстом: иначе румынская фраза осела бы в translations.json как «перевод»
+    return Translator(raise_exception=True)
+
+def run_async(coro):
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result()
+
+translator = get_translator()
+
+# === Кэш переводов в памяти процесса (LRU), сбрасывается на диск при остановке ===
+@st.cache_resource(show_spinner=False)
+def get_translation_cache() -> OrderedDict:
+    cache = OrderedDict()
+    try:
+        with open(TRANSLATIONS_FILE, "r", encoding="utf-8") as f:
+            for phrase, src, dest, text in json.load(f):
+                cache[(phrase, src, dest)] = text
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError):
+        # Битый или недописанный файл — начинаем с пустого кэша, а не падаем на каждом перезапуске
+        cache.clear()
+    atexit.register(save_translation_cache, cache)
+    return cache
+
+def save_translation_cache(cache: OrderedDict):
+    # Снимок — цикл событий в фоновом потоке может ещё дописывать кэш; файл подменяется целиком через os.replace
+    items = list(cache.items())
+    tmp_path = TRANSLATIONS_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump([[*key, text] for key, text in items], f, ensure_ascii=False)
+    os.replace(tmp_path, TRANSLATIONS_FILE)
+
+_translation_cache = get_translation_cache()
+
+def recall_translation(key: tuple):
+    text = _translation_cache.get(key)
+    if text is not None:
+        _translation_cache.move_to_end(key)
+    return text
+
+def remember_translation(key: tuple, text: str):
+    _translation_cache[key] = text
+    _translation_cache.move_to_end(key)
+    if len(_translation_cache) > TRANSLATION_CACHE_SIZE:
+        _translation_cache.popitem(last=False)
 
 # === Перевод и обработка ===
+def is_retryable(error: Exception) -> bool:
+    import httpx
+    return isinstance(error, httpx.TransportError) or bool(RETRY_STATUS_RE.search(str(error)))
+
+async def translate_with_retry(text: str, src='ro', dest='ru'):
+    for attempt in range(TRANSLATE_ATTEMPTS):
+        try:
+            return await translator.translate(text, src=src, dest=dest)
+        except Exception as e:
+            if attempt == TRANSLATE_ATTEMPTS - 1 or not is_retryable(e):
+                raise
+        await asyncio.sleep(min(TRANSLATE_MAX_BACKOFF, 2 ** attempt))
+
 async def translate_phrase(phrase: str, dest='ru') -> str:
+    key = (phrase, 'ro', dest)
+    cached = recall_translation(key)
+    if cached is not None:
+        return cached
     try:
-        translation = await translator.translate(phrase, src='ro', dest=dest)
-        return translation.text
+        translation = await translate_with_retry(phrase, 'ro', dest)
     except Exception as e:
         return f"[ошибка перевода: {e}]"
+    remember_translation(key, translation.text)
+    return translation.text
+
+async def translate_batch(phrases: List[str], dest='ru'):
+    # Пачка фраз уходит одним запросом, по строке на фразу; если строки не сошлись — пачку переводим по одной
+    try:
+        translation = await translate_with_retry("\n".join(phrases), 'ro', dest)
+    except Exception:
+        return None
+    lines = [line.strip() for line in translation.text.split("\n")]
+    return lines if len(lines) == len(phrases) else None
+
+def split_batches(phrases: List[str], max_chars: int = TRANSLATE_BATCH_CHARS) -> List[List[str]]:
+    batches, size = [[]], 0
+    for phrase in phrases:
+        if batches[-1] and size + len(phrase) + 1 > max_chars:
+            batches.append([])
+            size = 0
+        batches[-1].append(phrase)
+        size += len(phrase) + 1
+    return [batch for batch in batches if batch]
+
+async def translate_phrases(phrases: List[str], dest='ru') -> List[str]:
+    # Запросы идут параллельно, но не больше TRANSLATE_CONCURRENCY одновременно — чтобы не упереться в лимиты;
+    # ошибка одной фразы не роняет остальные
+    semaphore = asyncio.Semaphore(TRANSLATE_CONCURRENCY)
+    results = {phrase: recall_translation((phrase, 'ro', dest)) for phrase in phrases}
+    missing = [phrase for phrase, translation in results.items() if translation is None]
+
+    async def bounded(phrase: str) -> str:
+        async with semaphore:
+            return await translate_phrase(phrase, dest=dest)
+
+    async def bounded_batch(batch: List[str]):
+        async with semaphore:
+            lines = await translate_batch(batch, dest=dest)
+        if lines is None:
+            return await asyncio.gather(*(bounded(phrase) for phrase in batch))
+        for phrase, line in zip(batch, lines):
+            remember_translation((phrase, 'ro', dest), line)
+        return lines
+
+    batches = split_batches(missing)
+    for batch, lines in zip(batches, await asyncio.gather(*(bounded_batch(batch) for batch in batches))):
+        results.update(zip(batch, lines))
+    return [results[phrase] for phrase in phrases]
 
 def translate_ru_to_ro(phrase: str) -> str:
     try:
-        return asyncio.run(translator.translate(phrase, src='ru', dest='ro')).text
+        return run_async(translate_with_retry(phrase, 'ru', 'ro')).text
     except Exception as e:
         return f"[ошибка перевода: {e}]"
 
-def normalize(phrase: str) -> str:
-    words = phrase.lower().split()
-    return ' '.join(NORMALIZATION_MAP.get(w, w) for w in words)
+_NMAP_GET = NORMALIZATION_MAP.get
 
-def apply_replacements(phrase: str, rules: List[tuple]) -> str:
-    result = phrase.lower()
-    for orig, repl in rules:
-        result = result.replace(orig, repl)
-    return result
+def normalize_phrase(phrase: str) -> str:
+    return ' '.join(_NMAP_GET(w, w) for w in phrase.lower().split())
 
-def speak(phrase: str, filename: str, lang='ro'):
-    mp3_path = os.path.join(AUDIO_FOLDER, filename)
-    if not os.path.exists(mp3_path):
-        tts = gTTS(text=phrase, lang=lang)
-        tts.save(mp3_path)
-    return mp3_path
+def replace_with(phrase: str, compiled: tuple) -> str:
+    rules_regex, rules_map, table = compiled
+    result = phrase.lower()
+    if rules_regex is not None:
+        result = rules_regex.sub(lambda m: rules_map[m.group(0)], result)
+    return result.translate(table)
+
+def replace_by_kind(phrase: str, kind: str) -> str:
+    return replace_with(phrase, NAMED_RULES[kind])
+
+@st.cache_resource(show_spinner=False)
+def get_text_caches() -> tuple:
+    # lru_cache на уровне модуля обнулялся бы на каждом перезапуске скрипта; отсюда он живёт весь процесс
+    return lru_cache(maxsize=TEXT_CACHE_SIZE)(normalize_phrase), lru_cache(maxsize=TEXT_CACHE_SIZE)(replace_by_kind)
+
+normalize, replace_by_kind_cached = get_text_caches()
+
+def apply_replacements(phrase: str, rules) -> str:
+    if not rules:
+        return phrase.lower()
+    if isinstance(rules, list):
+        kind = RULE_KINDS.get(id(rules))
+        if kind:
+            return replace_by_kind_cached(phrase, kind)
+        rules = compile_rules(rules)
+    return replace_with(phrase, rules)
+
+@st.cache_resource(show_spinner=False)
+def get_tts_cache() -> tuple:
+    # Живёт между перезапусками скрипта, пока работает сервер Streamlit; LRU на TTS_CACHE_SIZE фраз.
+    # Замок — вместе с кэшем: speak зовётся из пула потоков разных сессий
+    return OrderedDict(), threading.Lock()
+
+_tts_cache, _tts_cache_lock = get_tts_cache()
+
+def recall_audio(key: str):
+    with _tts_cache_lock:
+        data = _tts_cache.get(key)
+        if data is not None:
+            _tts_cache.move_to_end(key)
+        return data
+
+def remember_audio(key: str, data: bytes):
+    with _tts_cache_lock:
+        _tts_cache[key] = data
+        _tts_cache.move_to_end(key)
+        if len(_tts_cache) > TTS_CACHE_SIZE:
+            _tts_cache.popitem(last=False)
+
+@st.cache_resource(show_spinner=False)
+def get_mp3_index() -> set:
+    # Имена mp3 на диске: папку сканируем один раз за процесс, дальше индекс пополняет speak
+    with os.scandir(AUDIO_FOLDER) as entries:
+        return {entry.name for entry in entries if entry.name.endswith(".mp3")}
+
+_mp3_index = get_mp3_index()
+
+def tts_key(phrase: str, lang='ro') -> str:
+    return hashlib.sha256(f"{lang}|{phrase}".encode("utf-8")).hexdigest()
+
+def tts_path(phrase: str, lang='ro') -> str:
+    return os.path.join(AUDIO_FOLDER, f"{tts_key(phrase, lang)}.mp3")
+
+def adopt_legacy_mp3(phrase: str, lang: str, mp3_path: str) -> bool:
+    # Старые версии называли файл «фраза_с_подчёркиваниями_язык.mp3» — переименовываем его под хэш, а не синтезируем заново
+    legacy_name = f"{phrase.replace(' ', '_')}_{lang}.mp3"
+    if legacy_name not in _mp3_index:
+        return False
+    try:
+        os.replace(os.path.join(AUDIO_FOLDER, legacy_name), mp3_path)
+    except OSError:
+        return False
+    finally:
+        _mp3_index.discard(legacy_name)
+    _mp3_index.add(os.path.basename(mp3_path))
+    return True
+
+@st.cache_resource(show_spinner=False)
+def get_tts_session():
+    # Одна keep-alive сессия на процесс: gTTS открывает новое соединение (и TLS-рукопожатие) на каждую фразу
+    import requests
+    session = requests.Session()
+    session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=TTS_WORKERS))
+    session.headers.update({
+        "Referer": "http://translate.google.com/",
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+        "Content-Type": "application/x-www-form-urlencoded;charset=utf-8",
+    })
+    return session
+
+def tts_fetch(phrase: str, lang='ro') -> bytes:
+    # Тот же RPC, что отправляет gTTS, только напрямую через общую сессию
+    rpc = [[["jQ1olc", json.dumps([phrase, lang, None, "null"], separators=(",", ":")), None, "generic"]]]
+    payload = urllib.parse.quote(json.dumps(rpc, separators=(",", ":")))
+    response = get_tts_session().post(TTS_URL, data=f"f.req={payload}&", timeout=15)
+    response.raise_for_status()
+    match = re.search(r'jQ1olc","\[\\"(.*?)\\"]', response.text)
+    if match is None:
+        raise ValueError("в ответе нет аудио")
+    return base64.b64decode(match.group(1))
+
+def synthesize(phrase: str, lang='ro') -> bytes:
+    if len(phrase) <= TTS_MAX_CHARS:
+        try:
+            return tts_fetch(phrase, lang)
+        except Exception:
+            pass  # запасной путь — сам gTTS
+    from gtts import gTTS
+    buffer = BytesIO()
+    gTTS(text=phrase, lang=lang).write_to_fp(buffer)
+    return buffer.getvalue()
+
+def write_file_atomic(path: str, data: bytes):
+    # Пишем во временный файл и подменяем целиком: параллельный читатель не увидит недописанный mp3
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def speak(phrase: str, lang='ro') -> bytes:
+    # Память → диск → синтез; имя mp3 — хэш от (язык, текст), без коллизий по пробелам и знакам
+    key = tts_key(phrase, lang)
+    data = recall_audio(key)
+    if data is not None:
+        return data
+    mp3_path = tts_path(phrase, lang)
+    if os.path.basename(mp3_path) in _mp3_index or adopt_legacy_mp3(phrase, lang, mp3_path):
+        try:
+            with open(mp3_path, "rb") as f:
+                data = f.read() or None  # пустой файл — след прерванной записи, синтезируем заново
+        except FileNotFoundError:
+            # Файл удалили снаружи — забываем его и синтезируем заново
+            _mp3_index.discard(os.path.basename(mp3_path))
+    if data is None:
+        data = synthesize(phrase, lang)
+        write_file_atomic(mp3_path, data)
+        _mp3_index.add(os.path.basename(mp3_path))
+    remember_audio(key, data)
+    return data
+
+@st.cache_resource(show_spinner=False)
+def get_audio_pool() -> tuple:
+    # Общий пул потоков и ещё не готовые фоновые файлы (имя mp3 → Future); потоков немного, чтобы не словить лимиты
+    return ThreadPoolExecutor(max_workers=TTS_WORKERS, thread_name_prefix="audio"), {}
+
+def ensure_audio(phrases: List[str], lang='ro') -> Dict[str, bytes]:
+    # gTTS упирается в сеть, поэтому параллелим потоками общего пула
+    unique = list(dict.fromkeys(phrases))
+    pool, _ = get_audio_pool()
+    return dict(zip(unique, pool.map(lambda phrase: speak(phrase, lang=lang), unique)))
+
+def prefetch_audio(phrases: List[str], lang='ro'):
+    # Следующая страница озвучивается в фоне, пока пользователь слушает текущую
+    pool, pending = get_audio_pool()
+    for phrase in dict.fromkeys(phrases):
+        name = os.path.basename(tts_path(phrase, lang))
+        if name in _mp3_index or name in pending:
+            continue
+        future = pool.submit(speak, phrase, lang)
+        pending[name] = future
+        future.add_done_callback(lambda _, name=name: pending.pop(name, None))
+
+def ensure_card_audio(phrases: List[str], lang='ro') -> Dict[str, bytes]:
+    # Карточкам отдаём байты, а не путь: файл могли удалить снаружи, а индекс и кэш в памяти об этом не знают
+    unique = list(dict.fromkeys(phrases))
+    # Уже запущенный фоновый синтез дожидаемся, а не повторяем
+    _, pending = get_audio_pool()
+    wait([future for future in (pending.get(os.path.basename(tts_path(phrase, lang))) for phrase in unique) if future is not None])
+    return ensure_audio(unique, lang)
+
+def iter_csv_cache(csv_path: str) -> Iterator[Dict[tuple, dict]]:
+    # Читаем кэш порциями: в памяти одновременно только один кусок DataFrame
+    if not os.path.exists(csv_path):
+        return
+    try:
+        reader = pd.read_csv(csv_path, dtype=str, keep_default_na=False, chunksize=CSV_CHUNK_ROWS)
+    except pd.errors.EmptyDataError:
+        return
+    with reader:
+        for chunk in reader:
+            for column, default in CSV_DEFAULTS.items():
+                if column not in chunk:
+                    chunk[column] = default
+            keys = zip(chunk['normalized'].str.strip(), chunk['lang'].str.strip())
+            yield dict(zip(keys, chunk.to_dict('records')))
+
+def sidecar_path(csv_path: str) -> str:
+    return os.path.splitext(csv_path)[0] + ".parquet"
+
+def read_sidecar(csv_path: str):
+    # Parquet-копия сессии читается в разы быстрее CSV; берём её, только если она не старше самого CSV
+    pq_path = sidecar_path(csv_path)
+    if not os.path.exists(pq_path) or file_mtime(pq_path) < file_mtime(csv_path):
+        return None
+    df = pd.read_parquet(pq_path)
+    for column, default in CSV_DEFAULTS.items():
+        if column not in df:
+            df[column] = default
+    return df
 
 def load_csv_cache(csv_path: str) -> Dict[str, dict]:
-    if not os.path.exists(csv_path):
-        return {}
+    df = read_sidecar(csv_path)
+    if df is not None:
+        return dict(zip(zip(df['normalized'].str.strip(), df['lang'].str.strip()), df.to_dict('records')))
     existing_data = {}
-    with open(csv_path, mode="r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            row = dict(row)
-            row.setdefault('known', '❌')
-            row.setdefault('category', '')
-            row.setdefault('date_added', '')
-            row.setdefault('date_known', '')
-            key = (row.get("normalized", "").strip(), row.get("lang", "").strip())
-            if key:
-                existing_data[key] = row
+    for chunk in iter_csv_cache(csv_path):
+        existing_data.update(chunk)
     return existing_data
 
 def save_csv_file(data: List[dict], csv_path: str):
-    with open(csv_path, mode="w", encoding="utf-8", newline="") as f:
-        writer = csv.DictWriter(
-            f,
-            fieldnames=[
-                "original", "normalized", "ipa", "ru_phonetic", "translation",
-                "lang", "known", "category", "date_added", "date_known"
-            ]
-        )
-        writer.writeheader()
-        writer.writerows(data)
-
-async def process_phrases(phrases: List[str], cache: Dict[str, dict], lang='ru', study_lang_code='ro') -> List[dict]:
-    results = []
-    for phrase in set(phrases):
-        normalized = normalize(phrase)
-        cache_key = (normalized, lang)
-        if cache_key in cache:
-            results.append(cache[cache_key])
-            continue
+    df = pd.DataFrame(data, columns=CSV_FIELDS).fillna('').astype(str)
+    df.to_csv(csv_path, index=False, encoding="utf-8")
+    # CSV остаётся для пользователя, Parquet — для быстрой повторной загрузки
+    df.to_parquet(sidecar_path(csv_path), index=False, compression="zstd")
+
+def cache_parts(cache_path: str = CACHE_FILE) -> List[str]:
+    # Дописанные порции кэша лежат рядом с основным файлом, по порядку записи
+    parts_folder = f"{cache_path}.parts"
+    if not os.path.isdir(parts_folder):
+        return []
+    return [os.path.join(parts_folder, name) for name in sorted(os.listdir(parts_folder)) if name.endswith(".parquet")]
+
+def frame_rows(df: pd.DataFrame) -> Dict[tuple, dict]:
+    return dict(zip(zip(df['normalized'].values, df['lang'].values), df.to_dict('records')))
+
+def load_cache(cache_path: str = CACHE_FILE) -> Dict[tuple, dict]:
+    existing_data = {}
+    paths = ([cache_path] if os.path.exists(cache_path) else []) + cache_parts(cache_path)
+    for path in paths:
+        existing_data.update(frame_rows(pd.read_parquet(path)))
+    return existing_data
+
+@st.cache_resource(show_spinner=False)
+def get_cache_store(cache_path: str) -> dict:
+    # Кэш фраз в памяти процесса и версия файлов, с которой он совпадает
+    return {'mtime': None, 'rows': {}}
+
+def load_cache_cached(cache_path: str = CACHE_FILE) -> Dict[tuple, dict]:
+    # Перечитываем файлы, только если их изменили снаружи; свои записи сразу вносятся в память
+    store = get_cache_store(cache_path)
+    mtime = cache_mtime(cache_path)
+    if store['mtime'] != mtime:
+        store['rows'] = load_cache(cache_path)
+        store['mtime'] = mtime
+    return store['rows']
+
+def file_mtime(path: str) -> float:
+    return os.path.getmtime(path) if os.path.exists(path) else 0.0
+
+def cache_mtime(cache_path: str = CACHE_FILE) -> float:
+    return max(file_mtime(cache_path), file_mtime(f"{cache_path}.parts"))
+
+def save_cache(data: List[dict], cache_path: str = CACHE_FILE):
+    # Полная перезапись: порции становятся не нужны
+    df = pd.DataFrame(data, columns=CSV_FIELDS).fillna('')
+    df.to_parquet(cache_path, index=False, compression='snappy')
+    for path in cache_parts(cache_path):
+        os.remove(path)
+    store = get_cache_store(cache_path)
+    store['rows'] = frame_rows(df)
+    store['mtime'] = cache_mtime(cache_path)
+
+def append_cache_rows(new_rows: List[dict], cache_path: str = CACHE_FILE):
+    # Пишем только новые строки отдельной порцией; когда порций много — сжимаем всё в один файл
+    store = get_cache_store(cache_path)
+    in_sync = store['mtime'] == cache_mtime(cache_path)
+    parts_folder = f"{cache_path}.parts"
+    os.makedirs(parts_folder, exist_ok=True)
+    part_path = os.path.join(parts_folder, f"{time.time_ns()}.parquet")
+    df = pd.DataFrame(new_rows, columns=CSV_FIELDS).fillna('')
+    df.to_parquet(part_path, index=False, compression='snappy')
+    if in_sync:
+        store['rows'].update(frame_rows(df))
+        store['mtime'] = cache_mtime(cache_path)
+    if len(cache_parts(cache_path)) >= CACHE_VACUUM_PARTS:
+        vacuum_cache(cache_path)
+
+def vacuum_cache(cache_path: str = CACHE_FILE):
+    save_cache(list(load_cache_cached(cache_path).values()), cache_path)
+
+def migrate_csv_cache():
+    # Одноразовый перенос кэша из CSV; ключи чистим сразу, чтобы при чтении не делать .strip()
+    if os.path.exists(CACHE_FILE) or not os.path.exists(CSV_CACHE_FILE):
+        return
+    rows = [
+        {**row, 'normalized': normalized, 'lang': lang}
+        for (normalized, lang), row in load_csv_cache(CSV_CACHE_FILE).items()
+    ]
+    save_cache(rows)
+
+def cache_csv_bytes() -> bytes:
+    # CSV для кнопки скачивания собирается один раз на версию кэша, а не на каждом перезапуске
+    rev = cache_mtime()
+    if st.session_state.get('_csv_bytes_rev') != rev:
+        rows = list(load_cache_cached().values())
+        st.session_state['_csv_bytes'] = pd.DataFrame(rows, columns=CSV_FIELDS).to_csv(index=False).encode("utf-8")
+        st.session_state['_csv_bytes_rev'] = rev
+    return st.session_state['_csv_bytes']
+
+async def process_phrases(phrases: List[str], cache: Dict[str, dict], lang='ru', study_lang_code='ro', category='') -> tuple:
+    # Одна единица работы на нормализованную форму ("Bună" и "bună" — одно и то же), порядок ввода сохраняется
+    unique = {}
+    for phrase in phrases:
+        unique.setdefault(normalize(phrase), phrase)
+    new_rows = []
+    to_translate = {normalized: phrase for normalized, phrase in unique.items() if (normalized, lang) not in cache}
+    # Строки кэша общие для всех сессий процесса: наружу отдаём копии, иначе отметки «знаю» одной сессии попадут в кэш
+    if not to_translate:
+        return [dict(cache[(normalized, lang)]) for normalized in unique], new_rows
+
+    # Перевод и озвучка идут параллельно: gTTS блокирующий, поэтому уходит в потоки
+    normalized_list = list(to_translate)
+    translations, _ = await asyncio.gather(
+        translate_phrases(normalized_list, dest=lang if lang != study_lang_code else 'ru'),
+        asyncio.to_thread(ensure_audio, normalized_list, study_lang_code),
+    )
+    for normalized, translation in zip(normalized_list, translations):
         result = {
-            'original': phrase,
+            'original': to_translate[normalized],
             'normalized': normalized,
             'ipa': apply_replacements(normalized, IPA_REPLACEMENTS if study_lang_code == 'ro' else []),
             'ru_phonetic': apply_replacements(normalized, RU_REPLACEMENTS if study_lang_code == 'ro' else []),
-            'translation': await translate_phrase(normalized, dest=lang if lang != study_lang_code else 'ru'),
+            'translation': translation,
             'lang': lang,
             'known': '❌',
-            'category': st.session_state.get("category_input", "").strip(),
+            'category': category,
             'date_added': datetime.now().strftime('%Y-%m-%d'),
             'date_known': '',
         }
-        cache[cache_key] = result
-        results.append(result)
-        speak(normalized, f"{normalized.replace(' ', '_')}_{study_lang_code}.mp3", lang=study_lang_code)
-    return results
+        new_rows.append(result)
+    fresh = {row['normalized']: row for row in new_rows}
+    return [dict(fresh.get(normalized) or cache[(normalized, lang)]) for normalized in unique], new_rows
+
+def silence_mp3(duration=500) -> bytes:
+    # Тишина в формате gTTS (24 кГц, моно, 32 кбит/с) без ID3/Xing-заголовков: MP3-кадры можно просто склеивать
+    path = os.path.join(AUDIO_FOLDER, f"silence_{duration}ms.mp3")
+    if not os.path.exists(path):
+        from pydub import AudioSegment
+        AudioSegment.silent(duration=duration, frame_rate=24000).export(
+            path, format="mp3", bitrate="32k", parameters=["-write_xing", "0", "-id3v2_version", "0"]
+        )
+    with open(path, "rb") as f:
+        return f.read()
+
+def join_audio(clips: List[bytes], pause_ms: int):
+    # PCM копится в одном bytearray: `combined += seg` копировал бы весь растущий буфер на каждом шаге
+    from pydub import AudioSegment
+    # Каждый ffmpeg-процесс декодирует свой клип параллельно; повторяющиеся клипы декодируются один раз
+    unique = list(dict.fromkeys(clips))
+    pool, _ = get_audio_pool()
+    decoded = dict(zip(unique, pool.map(lambda data: AudioSegment.from_file(BytesIO(data), format="mp3"), unique)))
+    buffer = bytearray()
+    params = None
+    for data in clips:
+        seg = decoded[data]
+        if params is None:
+            params = seg.frame_rate, seg.sample_width, seg.channels
+            pause = b"\0" * (int(params[0] * pause_ms / 1000) * params[1] * params[2])
+        else:
+            seg = seg.set_frame_rate(params[0]).set_sample_width(params[1]).set_channels(params[2])
+        buffer.extend(seg.raw_data)
+        buffer.extend(pause)
+    if params is None:
+        return AudioSegment.empty()
+    return AudioSegment(bytes(buffer), frame_rate=params[0], sample_width=params[1], channels=params[2])
+
+def mix_audio(items: List[tuple], pause_ms: int) -> bytes:
+    # Готовая склейка хранится на диске под хэшем списка (текст, язык): повторное воспроизведение — просто чтение файла
+    key = tts_key("\n".join(f"{lang}|{text}" for text, lang in items), f"mix{pause_ms}")
+    path = os.path.join(AUDIO_FOLDER, f"mix_{key}.mp3")
+    if os.path.exists(path):
+        os.utime(path)  # отметка использования для prune_mix_files
+        with open(path, "rb") as f:
+            return f.read()
+    audio = {lang: ensure_audio([text for text, l in items if l == lang], lang) for lang in {l for _, l in items}}
+    # Кодируем в память и отдаём эти же байты; битрейт как у исходников gTTS — выше смысла нет
+    buffer = BytesIO()
+    join_audio([audio[lang][text] for text, lang in items], pause_ms).export(buffer, format="mp3", bitrate="32k")
+    data = buffer.getvalue()
+    write_file_atomic(path, data)
+    prune_mix_files()
+    return data
+
+def prune_mix_files(keep: int = MIX_FILES_KEEP):
+    mixes = sorted(
+        (entry for entry in os.scandir(AUDIO_FOLDER) if entry.name.startswith("mix_") and entry.name.endswith(".mp3")),
+        key=lambda entry: entry.stat().st_mtime,
+        reverse=True,
+    )
+    for entry in mixes[keep:]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+def make_zip_of_audio(phrases: List[str], results: List[dict], with_translation=False, lang='ru', study_lang_code='ro') -> bytes:
+    pairs = tuple((row['normalized'], row['translation']) for row in results)
+    return build_audio_zip(pairs, with_translation, lang, study_lang_code)
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def build_audio_zip(pairs: tuple, with_translation: bool, lang: str, study_lang_code: str) -> bytes:
+    # Архив собирается один раз на набор фраз, а не на каждом перезапуске скрипта
+    audio = ensure_audio([normalized for normalized, _ in pairs], study_lang_code)
+    if with_translation:
+        tr_audio = ensure_audio([translation for _, translation in pairs], lang)
+        silence = silence_mp3(500)
 
-def make_zip_of_audio(phrases: List[str], results: List[dict], with_translation=False, lang='ru', study_lang_code='ro') -> BytesIO:
     zip_buffer = BytesIO()
-    with zipfile.ZipFile(zip_buffer, "w") as zip_file:
-        for row in results:
-            normalized = row['normalized']
+    seen = set()
+    # mp3 уже сжат — deflate только тратил бы процессор
+    with zipfile.ZipFile(zip_buffer, "w", compression=zipfile.ZIP_STORED) as zip_file:
+        for normalized, translation in pairs:
+            # Одна фраза может встречаться в нескольких строках (другой язык перевода, категория)
+            if normalized in seen:
+                continue
+            seen.add(normalized)
             base_name = normalized.replace(' ', '_')
-            ro_file = f"{base_name}_{study_lang_code}.mp3"
-            ro_path = speak(normalized, ro_file, lang=study_lang_code)
-            zip_file.write(ro_path, arcname=ro_file)
-
+            zip_file.writestr(f"{base_name}_{study_lang_code}.mp3", audio[normalized])
             if with_translation:
-                trans_text = row['translation']
-                tr_file = f"{base_name}_{lang}.mp3"
-                tr_path = speak(trans_text, tr_file, lang=lang)
-                merged = AudioSegment.from_file(ro_path) + AudioSegment.silent(duration=500) + AudioSegment.from_file(tr_path)
-                final_path = os.path.join(AUDIO_FOLDER, f"{base_name}_combo.mp3")
-                merged.export(final_path, format="mp3")
-                zip_file.write(final_path, arcname=f"{base_name}_combo.mp3")
-    zip_buffer.seek(0)
-    return zip_buffer
+                # Склейка MP3-кадров прямо в архив: без перекодирования и промежуточных файлов
+                zip_file.writestr(f"{base_name}_combo.mp3", audio[normalized] + silence + tr_audio[translation])
+    return zip_buffer.getvalue()
 GOALS_FILE = "daily_goals.json"
 def load_goals() -> dict:
     if os.path.exists(GOALS_FILE):
@@ -184,14 +704,86 @@ def plural_ru(n: int, forms=("фраза", "фразы", "фраз")) -> str:
         return forms[1]
     return forms[2]
         
+# === Сессии: список файлов и разбор CSV кэшируются ===
+@st.cache_data(ttl=2.0, show_spinner=False)
+def list_sessions() -> List[str]:
+    with os.scandir(LAST_SESSION_FOLDER) as entries:
+        return sorted(e.name for e in entries if e.name.endswith(".csv") and e.is_file(follow_symlinks=False))
+
+@st.cache_data(show_spinner=False)
+def read_session(path: str, mtime: float) -> List[dict]:
+    # mtime в ключе: после сохранения сессия перечитывается, иначе берётся из кэша
+    df = read_sidecar(path)
+    if df is not None:
+        return df.to_dict('records')
+    with open(path, mode="r", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+def session_rows(path: str) -> Dict[tuple, dict]:
+    # Разобранная сессия живёт в session_state и дополняется на месте; перечитываем, только если файл изменили снаружи
+    session_cache = st.session_state.setdefault('session_cache', {})
+    mtime = file_mtime(path)
+    if path not in session_cache or session_cache[path][0] != mtime:
+        session_cache[path] = (mtime, load_csv_cache(path))
+    return session_cache[path][1]
+
+def save_session_rows(path: str, rows: Dict[tuple, dict]):
+    save_csv_file(list(rows.values()), path)
+    st.session_state['session_cache'][path] = (file_mtime(path), rows)
+
+# === Фильтрация результатов (векторно, через pandas) ===
+def set_results(rows: List[dict], source=None):
+    # Каждое новое содержимое results получает свой номер ревизии; source — откуда строки (файл сессии и его mtime):
+    # та же сессия, перечитанная на перезапуске, ревизию не меняет
+    st.session_state['results'] = rows
+    if source is None or source != st.session_state.get('results_source'):
+        st.session_state['results_rev'] = st.session_state.get('results_rev', 0) + 1
+    st.session_state['results_source'] = source
+
+def results_frame() -> pd.DataFrame:
+    # Текстовые колонки в нижнем регистре; пересобираем, только если сменилась ревизия results
+    results = st.session_state['results']
+    rev = st.session_state.get('results_rev')
+    if st.session_state.get('results_df_rev') != rev or 'results_df' not in st.session_state:
+        df = pd.DataFrame(results, columns=['original', 'translation', 'category', 'lang']).fillna('')
+        df['category'] = df['category'].str.strip()
+        df['original_lc'] = df['original'].str.lower()
+        df['translation_lc'] = df['translation'].str.lower()
+        st.session_state['results_df'] = df
+        st.session_state['results_df_rev'] = rev
+    return st.session_state['results_df']
+
+def match_text(df: pd.DataFrame, query: str) -> List[int]:
+    query = query.lower()
+    mask = (
+        df['original_lc'].str.contains(query, regex=False, na=False)
+        | df['translation_lc'].str.contains(query, regex=False, na=False)
+    )
+    return mask.to_numpy().nonzero()[0].tolist()
+
+def filter_results(query: str, category: str = '', lang: str = '') -> List[dict]:
+    # Пустой фильтр не участвует; порядок строк сохраняется
+    results = st.session_state['results']
+    if not results or not (query or category or lang):
+        return list(results)
+    df = results_frame()
+    if query:
+        df = df.iloc[match_text(df, query)]
+    if category:
+        df = df[df['category'].eq(category)]
+    if lang:
+        df = df[df['lang'].eq(lang)]
+    return [results[i] for i in df.index]
+
+migrate_csv_cache()
+
 # === Streamlit UI ===
-st.set_page_config(page_title="Romanian Transcriber", layout="wide")
 st.title("📘 Transcriber & Translator")
 
 study_lang = st.selectbox("🧠 Язык изучения:", ["Румынский (ro)", "Английский (en)"], index=0)
 study_lang_code = "ro" if "ro" in study_lang else "en"
 
-session_files = [f for f in os.listdir(LAST_SESSION_FOLDER) if f.endswith(".csv")]
+session_files = list_sessions()
 load_session = st.selectbox("📂 Загрузить сессию:", ["(не выбрана)"] + session_files)
 
 input_method = st.radio("Выберите способ ввода:", ["Ввод вручную", "Загрузка .txt файла"])
@@ -204,13 +796,13 @@ phrases = []
 if 'manual_input' not in st.session_state:
     st.session_state['manual_input'] = ""
 if 'results' not in st.session_state:
-    st.session_state['results'] = []
+    set_results([])
 
 if load_session != "(не выбрана)":
     try:
-        with open(os.path.join(LAST_SESSION_FOLDER, load_session), mode="r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            st.session_state['results'] = list(reader)
+        session_path = os.path.join(LAST_SESSION_FOLDER, load_session)
+        session_mtime = os.path.getmtime(session_path)
+        set_results(read_session(session_path, session_mtime), source=(session_path, session_mtime))
         st.success(f"Сессия {load_session} загружена.")
     except Exception as e:
         st.warning(f"Ошибка загрузки сессии: {e}")
@@ -220,7 +812,7 @@ if input_method == "Ввод вручную":
     category_input = st.text_input("🏷️ Категория (опционально):", key="category_input")
     if st.button("Добавить перевод", key="add_translation"):
         try:
-            ro_phrase = asyncio.run(translator.translate(ru_input, src=translation_lang[1], dest=study_lang_code)).text
+            ro_phrase = run_async(translate_with_retry(ru_input, translation_lang[1], study_lang_code)).text
             st.session_state['manual_input'] += ("\n" if st.session_state['manual_input'] else "") + ro_phrase.strip()
         except Exception as e:
             st.warning(f"[ошибка перевода: {e}]")
@@ -235,18 +827,21 @@ else:
 
 if phrases and st.button("▶️ Обработать"):
     with st.spinner("Обработка..."):
-        cache = load_csv_cache(CSV_CACHE_FILE)
-        results = asyncio.run(process_phrases(phrases, cache, lang=translation_lang[1], study_lang_code=study_lang_code))
-        save_csv_file(list(cache.values()), CSV_CACHE_FILE)
+        cache = load_cache_cached()
+        results, new_rows = run_async(process_phrases(
+            phrases, cache, lang=translation_lang[1], study_lang_code=study_lang_code,
+            category=st.session_state.get("category_input", "").strip()
+        ))
+        if new_rows:
+            append_cache_rows(new_rows)
         if save_last_session:
             if load_session != "(не выбрана)" and append_to_current_session:
                 # 🔁 Добавляем к текущей сессии
                 existing_path = os.path.join(LAST_SESSION_FOLDER, load_session)
-                merged = load_csv_cache(existing_path)
-                for r in results:
-                    merged[(r['normalized'], r['lang'])] = r
-                save_csv_file(list(merged.values()), existing_path)
-                st.session_state['results'] = list(merged.values())
+                merged = session_rows(existing_path)
+                merged.update(((r['normalized'], r['lang']), r) for r in results)
+                save_session_rows(existing_path, merged)
+                set_results(list(merged.values()))
 
                 st.success(f"Слова добавлены в сессию: {load_session}")
             else:
@@ -255,56 +850,10 @@ if phrases and st.button("▶️ Обработать"):
                 save_csv_file(results, os.path.join(LAST_SESSION_FOLDER, session_name))
                 st.success(f"Создана новая сессия: {session_name}")
         if not (load_session != "(не выбрана)" and append_to_current_session):        
-            st.session_state['results'] = results
+            set_results(results)
         
     st.success("✅ Готово!")
 
-if st.session_state['results']:
-    filter_text = st.text_input("🔍 Фильтр по фразе или переводу:")
-    filtered = [row for row in st.session_state['results'] if filter_text.lower() in row['original'].lower() or filter_text.lower() in row['translation'].lower()]
-
-    st.download_button("📥 Скачать CSV", data=open(CSV_CACHE_FILE, "rb"), file_name="results.csv")
-
-    audio_zip = make_zip_of_audio([row['original'] for row in filtered], filtered, lang=translation_lang[1], study_lang_code=study_lang_code)
-    st.download_button("🔊 Скачать MP3 (архив)", data=audio_zip, file_name="audio_files.zip")
-
-    st.subheader("📊 Результаты:")
-    st.dataframe(filtered, use_container_width=True)
-
-    st.subheader("🎧 Прослушать озвучку:")
-    if st.button("▶️ Воспроизвести всё"):
-        combined = AudioSegment.empty()
-        for row in filtered:
-            filename = f"{row['normalized'].replace(' ', '_')}_{study_lang_code}.mp3"
-            path = speak(row['normalized'], filename, lang=study_lang_code)
-            if os.path.exists(path):
-                combined += AudioSegment.from_file(path) + AudioSegment.silent(duration=300)
-        buffer = BytesIO()
-        combined.export(buffer, format="mp3")
-        buffer.seek(0)
-        b64 = base64.b64encode(buffer.read()).decode()
-        st.markdown(f"""
-            <audio autoplay controls loop>
-            <source src="data:audio/mp3;base64,{b64}" type="audio/mp3">
-            </audio>
-        """, unsafe_allow_html=True)
-
-    if st.checkbox("🔁 Включить двойную озвучку (фраза + перевод)"):
-        combo_audio = AudioSegment.empty()
-        for row in filtered:
-            base = row['normalized'].replace(' ', '_')
-            ro_path = speak(row['normalized'], f"{base}_{study_lang_code}.mp3", lang=study_lang_code)
-            tr_path = speak(row['translation'], f"{base}_{translation_lang[1]}.mp3", lang=translation_lang[1])
-            if os.path.exists(ro_path) and os.path.exists(tr_path):
-                seg = AudioSegment.from_file(ro_path) + AudioSegment.silent(duration=500) + AudioSegment.from_file(tr_path)
-                combo_audio += seg + AudioSegment.silent(duration=500)
-        if len(combo_audio) > 0:
-            combined_path = os.path.join(AUDIO_FOLDER, "all_combined.mp3")
-            combo_audio.export(combined_path, format="mp3")
-            st.audio(combined_path, format="audio/mp3")
-            double_zip = make_zip_of_audio([row['original'] for row in filtered], filtered, with_translation=True, lang=translation_lang[1], study_lang_code=study_lang_code)
-            st.download_button("📥 Скачать двойную озвучку (zip)", data=double_zip, file_name="combo_audio.zip")
-            
 # === Если есть результаты, показываем фильтр и вкладки ===
 if st.session_state['results']:
     st.markdown("---")
@@ -321,15 +870,23 @@ if st.session_state['results']:
         st.session_state['known_map'] = {}
         st.session_state['date_known_map'] = {}
         
-    all_categories = sorted(set(r.get("category", "").strip() for r in st.session_state['results'] if r.get("category")))
-    selected_category = st.selectbox("📂 Категория:", ["(все)"] + all_categories, index=0)
+    results_df = results_frame()
+    all_categories = sorted(set(results_df['category']) - {''})
+    all_langs = sorted(set(results_df['lang']) - {''})
+    col1, col2 = st.columns([3, 2])
+    with col1:
+        selected_category = st.selectbox("📂 Категория:", ["(все)"] + all_categories, index=0)
+    with col2:
+        selected_lang = st.selectbox("🌐 Язык перевода:", ["(все)"] + all_langs, index=0)
 
     # 🧠 Фильтрация и статус
     df_display = [
-        r for r in st.session_state['results']
-        if (not show_only_unknown or r.get("known") != '✅')
-        and (selected_category == "(все)" or r.get("category", "") == selected_category)
-        and (filter_text.lower() in r['original'].lower() or filter_text.lower() in r['translation'].lower())
+        r for r in filter_results(
+            filter_text,
+            category='' if selected_category == "(все)" else selected_category,
+            lang='' if selected_lang == "(все)" else selected_lang,
+        )
+        if not show_only_unknown or r.get("known") != '✅'
     ]
 
     # === Вкладки ===
@@ -340,18 +897,52 @@ if st.session_state['results']:
     selected_tab_index = st.session_state['active_tab']
 
     # === Вкладка карточек ===
-    with tabs[1]:
+    # Фрагмент: отметки и листание страниц перезапускают только карточки, а не всю страницу
+    @st.fragment
+    def render_cards(df_display: List[dict]):
         st.subheader("🧠 Учим фразы")
 
-        for idx, row in enumerate(df_display):
-            normalized_key = row['normalized']
-            lang_key = row['lang']
+        # Статус known из session_state — для всех строк, это дёшево; виджеты — только для текущей страницы
+        for row in df_display:
+            k = (row['normalized'], row['lang'])
+            row['known'] = st.session_state['known_map'].get(k, row.get('known', '❌'))
+            row['date_known'] = st.session_state['date_known_map'].get(k, row.get('date_known', ''))
+
+        page_count = max(1, (len(df_display) + CARDS_PAGE_SIZE - 1) // CARDS_PAGE_SIZE)
+        page = st.number_input("Страница", min_value=1, max_value=page_count, value=1, step=1, key="cards_page")
+        start = (page - 1) * CARDS_PAGE_SIZE
+        page_rows = df_display[start:start + CARDS_PAGE_SIZE]
+
+        # Отметки «знаю» — одним редактором на страницу вместо двух кнопок на карточку.
+        # Ключ — по составу страницы: правки редактора позиционные и не должны переезжать на другие строки после фильтра
+        if page_rows:
+            page_keys = tuple((row['normalized'], row['lang']) for row in page_rows)
+            edited = st.data_editor(
+                pd.DataFrame({
+                    'original': [row['original'] for row in page_rows],
+                    'translation': [row['translation'] for row in page_rows],
+                    'known': pd.Series([row['known'] == '✅' for row in page_rows], dtype=bool),
+                }),
+                column_config={'known': st.column_config.CheckboxColumn("✅ Знаю")},
+                disabled=['original', 'translation'],
+                hide_index=True,
+                use_container_width=True,
+                key="cards_editor_" + hashlib.sha1(repr(page_keys).encode('utf-8')).hexdigest(),
+            )
+            for row, is_known in zip(page_rows, edited['known']):
+                known_val = '✅' if is_known else '❌'
+                if known_val != row['known']:
+                    k = (row['normalized'], row['lang'])
+                    st.session_state['known_map'][k] = known_val
+                    st.session_state['date_known_map'][k] = datetime.now().strftime('%Y-%m-%d') if is_known else ''
+                    row['known'] = known_val
+                    row['date_known'] = st.session_state['date_known_map'][k]
 
-            # Загрузим статус known
-            known_val = st.session_state['known_map'].get((normalized_key, lang_key), row.get('known', '❌'))
-            row['known'] = known_val
-            date_known_val = st.session_state['date_known_map'].get((normalized_key, lang_key), row.get('date_known', ''))
-            row['date_known'] = date_known_val
+        card_audio = ensure_card_audio([row['normalized'] for row in page_rows], study_lang_code)
+        next_rows = df_display[start + CARDS_PAGE_SIZE:start + 2 * CARDS_PAGE_SIZE]
+        prefetch_audio([row['normalized'] for row in next_rows], study_lang_code)
+        for idx, row in enumerate(page_rows):
+            known_val = row['known']
 
             # Автооткрытие первой незнакомой карточки
             auto_open = True if show_only_unknown and known_val != '✅' and idx == 0 else False
@@ -362,12 +953,7 @@ if st.session_state['results']:
                 if row.get("category"):
                     st.markdown(f"🏷️ Категория: _{row['category']}_")
 
-                audio_path = speak(
-                    row['normalized'],
-                    f"{row['normalized'].replace(' ', '_')}_{study_lang_code}.mp3",
-                    lang=study_lang_code
-                )
-                st.audio(audio_path)
+                st.audio(card_audio[row['normalized']], format="audio/mp3")
 
                 # Цветной статус
                 status_color = "green" if known_val == '✅' else "red"
@@ -376,27 +962,16 @@ if st.session_state['results']:
                     unsafe_allow_html=True
                 )
 
-                # Кнопки
-                col1, col2 = st.columns(2)
-                if col1.button("✅ Знаю", key=f"know_{idx}"):
-                    k = (normalized_key, lang_key)
-                    st.session_state['known_map'][k] = '✅'
-                    st.session_state['date_known_map'][k] = datetime.now().strftime('%Y-%m-%d')
-                    row['known'] = '✅'
-                    row['date_known'] = st.session_state['date_known_map'][k]
-                if col2.button("❌ Не знаю", key=f"dontknow_{idx}"):
-                    st.session_state['known_map'][k] = '❌'
-                    st.session_state['date_known_map'][k] = ''
-                    row['known'] = '❌'
-                    row['date_known'] = ''
-
         if st.button("💾 Сохранить карточки", key="save_cards"):
-            save_csv_file(st.session_state['results'], CSV_CACHE_FILE)
+            save_cache(st.session_state['results'])
             # Если загружена сессия — обновим её тоже
             if load_session != "(не выбрана)":
                 save_csv_file(st.session_state['results'], os.path.join(LAST_SESSION_FOLDER, load_session))
             st.success("Карточки сохранены!")
 
+    with tabs[1]:
+        render_cards(df_display)
+
     # === Вкладка таблицы ===
     with tabs[0]:
         st.subheader("📊 Результаты:")
@@ -417,7 +992,7 @@ if st.session_state['results']:
         )
 
         if st.button("💾 Сохранить с прогрессом", key="save_known"):
-            save_csv_file(st.session_state['results'], CSV_CACHE_FILE)
+            save_cache(st.session_state['results'])
             
             # Если загружена сессия — обновим её тоже
             if load_session != "(не выбрана)":
@@ -425,6 +1000,32 @@ if st.session_state['results']:
         
             st.success("Сохранено!")
 
+        st.download_button("📥 Скачать CSV", data=cache_csv_bytes(), file_name="results.csv")
+
+        audio_zip = make_zip_of_audio([row['original'] for row in df_display], df_display, lang=translation_lang[1], study_lang_code=study_lang_code)
+        st.download_button("🔊 Скачать MP3 (архив)", data=audio_zip, file_name="audio_files.zip")
+
+        st.subheader("🎧 Прослушать озвучку:")
+        if st.button("▶️ Воспроизвести всё"):
+            combined = mix_audio([(row['normalized'], study_lang_code) for row in df_display], pause_ms=300)
+            b64 = base64.b64encode(combined).decode()
+            st.markdown(f"""
+                <audio autoplay controls loop>
+                <source src="data:audio/mp3;base64,{b64}" type="audio/mp3">
+                </audio>
+            """, unsafe_allow_html=True)
+
+        if st.checkbox("🔁 Включить двойную озвучку (фраза + перевод)"):
+            if df_display:
+                # фраза, пауза, перевод, пауза — одинаковые паузы по 500 мс
+                combo_audio = mix_audio(
+                    [item for row in df_display for item in ((row['normalized'], study_lang_code), (row['translation'], translation_lang[1]))],
+                    pause_ms=500
+                )
+                st.audio(combo_audio, format="audio/mp3")
+                double_zip = make_zip_of_audio([row['original'] for row in df_display], df_display, with_translation=True, lang=translation_lang[1], study_lang_code=study_lang_code)
+                st.download_button("📥 Скачать двойную озвучку (zip)", data=double_zip, file_name="combo_audio.zip")
+
     with tabs[2]:
         st.subheader("📊 Статистика изучения")
         # Загружаем цели
@@ -442,10 +1043,11 @@ if st.session_state['results']:
             st.success("Цель на сегодня обновлена!")
             daily_goal = new_goal  # Обновим для расчёта ниже
 
-        today_known = sum(
-            1 for row in st.session_state['results']
-            if row.get("known") == "✅" and row.get("date_known") == today_str
-        )
+        # Одна таблица на вкладку, дальше — только векторные операции pandas
+        stats_df = pd.DataFrame(
+            st.session_state['results'], columns=["category", "date_added", "known", "date_known"]
+        ).fillna('')
+        today_known = int((stats_df['known'].eq("✅") & stats_df['date_known'].eq(today_str)).sum())
         percent_today = int((100 * today_known / daily_goal) if daily_goal > 0 else 0)
         st.markdown(f"📅 Сегодня выучено: **{today_known} из {daily_goal}** ({percent_today}%)")
         st.progress(percent_today)
@@ -457,40 +1059,21 @@ if st.session_state['results']:
             # if st.button("Перейти к изучению ⏩", key="go_to_flashcards"):
             #     st.session_state['active_tab'] = 1  # Устанавливаем вкладку "Карточки"
 
-        all_stats_categories = sorted(set(
-            r.get("category", "").strip() for r in st.session_state['results'] if r.get("category")
-        ))
+        all_stats_categories = sorted(c for c in stats_df['category'].str.strip().unique() if c)
 
         selected_stat_category = st.selectbox("📂 Фильтр по категории:", ["(все)"] + all_stats_categories, index=0)
 
         # Фильтруем фразы по категории
-        filtered_results = [
-            row for row in st.session_state['results']
-            if selected_stat_category == "(все)" or row.get("category") == selected_stat_category
-        ]
-
-        # Считаем добавленные фразы
-        added_dates = [row.get("date_added", "") for row in filtered_results if row.get("date_added")]
-        added_counts = Counter(added_dates)
-
-        # Считаем выученные фразы
-        known_dates = [
-            row.get("date_known", "")
-            for row in filtered_results
-            if row.get("known") == '✅' and row.get("date_known")
-        ]
-        known_counts = Counter(known_dates)
-
+        if selected_stat_category != "(все)":
+            stats_df = stats_df[stats_df['category'].eq(selected_stat_category)]
 
-        # Объединяем все даты
-        all_dates = sorted(set(added_counts.keys()) | set(known_counts.keys()))
+        # Считаем добавленные и выученные фразы по датам
+        added_counts = stats_df.loc[stats_df['date_added'].ne(''), 'date_added'].value_counts()
+        known_counts = stats_df.loc[stats_df['known'].eq('✅') & stats_df['date_known'].ne(''), 'date_known'].value_counts()
 
         # Строим таблицу
-        chart_df = pd.DataFrame({
-            "Дата": all_dates,
-            "Добавлено": [added_counts.get(date, 0) for date in all_dates],
-            "Выучено": [known_counts.get(date, 0) for date in all_dates]
-        }).set_index("Дата")
+        chart_df = pd.concat({"Добавлено": added_counts, "Выучено": known_counts}, axis=1).fillna(0).astype(int).sort_index()
+        chart_df.index.name = "Дата"
 
         if not chart_df.empty:
             st.bar_chart(chart_df)
@@ -569,3 +1152,12 @@ if st.session_state['results']:
             st.code("Первый из session_state['results']:")
             st.json(st.session_state['results'][0])
 
+        # Кэши инвалидируются по mtime сами; кнопка — на случай, если файлы подменили с тем же временем
+        if st.button("🧹 Очистить кэш", key="clear_cache"):
+            st.cache_data.clear()
+            get_cache_store.clear()
+            # Всё аудио, прочитанное с диска: индекс имён и mp3-байты в памяти — иначе удалённые файлы не пересоздадутся
+            get_mp3_index.clear()
+            get_tts_cache.clear()
+            st.session_state.pop('session_cache', None)
+            st.rerun()
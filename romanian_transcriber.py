@@ -1,8 +1,19 @@
 import asyncio
 import csv
+import hashlib
 import os
+import re
+import sqlite3
+import subprocess
+import sys
+import time
 import argparse
-from typing import List, Set, Dict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, astuple
+from functools import lru_cache
+from io import BytesIO
+from typing import List, Dict
+import httpx
 from googletrans import Translator
 from gtts import gTTS
 
@@ -11,6 +22,17 @@ NORMALIZATION_MAP = {
     'vinere': 'vineri'
 }
 
+CSV_FIELDS = ["original", "normalized", "ipa", "ru_phonetic", "translation"]
+
+# Новая запись; поля — в порядке колонок CSV
+@dataclass(slots=True)
+class Transcription:
+    original: str
+    normalized: str
+    ipa: str
+    ru_phonetic: str
+    translation: str
+
 # Транскрипционные замены
 IPA_REPLACEMENTS = [
     ('ce', 't͡ʃe'), ('ci', 't͡ʃi'), ('ge', 'd͡ʒe'), ('gi', 'd͡ʒi'),
@@ -31,30 +53,197 @@ RU_REPLACEMENTS = [
     ('t', 'т'), ('v', 'в'), ('w', 'в'), ('x', 'кс'), ('y', 'и'), ('z', 'з')
 ]
 
-translator = Translator()
+# Одновременных запросов к Google не больше этого — иначе ловим 429
+CONCURRENCY = 8
+# Фразы без перевода уходят пачками по строке на фразу; лимит символов на один запрос
+TRANSLATE_BATCH_CHARS = 4000
+# Озвучка идёт в отдельном пуле: размер пула и есть лимит одновременных запросов к gTTS
+TTS_WORKERS = 5
+# Повторы при 429/5xx и сетевых сбоях: экспоненциальная пауза, не дольше TRANSLATE_MAX_BACKOFF секунд
+TRANSLATE_ATTEMPTS = 5
+TRANSLATE_MAX_BACKOFF = 30
+# Общий темп запросов к переводчику, запросов в секунду
+TRANSLATE_RATE = 5
+RETRY_STATUS_RE = re.compile(r'status code "(429|5\d\d)"')
+
+tts_pool = ThreadPoolExecutor(max_workers=TTS_WORKERS)
+
+# Один проход регуляркой: длинные ключи первыми, так 'ce' всегда побеждает 'c'
+def compile_rules(rules: List[tuple]) -> tuple:
+    table = dict(rules)
+    single = {orig: repl for orig, repl in table.items() if len(orig) == 1}
+    multi = [orig for orig in table if len(orig) > 1]
+    # apply_replacements делает два прохода: регулярка по сочетаниям, затем str.translate по буквам.
+    # Если замена сочетания содержит букву-ключ, второй проход испортил бы её — тогда все правила идут одной
+    # регуляркой. У IPA и RU замены из других алфавитов, так что это страховка на случай новых правил
+    if any(ch in single for orig in multi for ch in table[orig]):
+        single, multi = {}, list(table)
+    # Сначала длинные ключи: иначе 'c' перехватит начало 'ce'
+    keys = sorted(multi, key=len, reverse=True)
+    pattern = re.compile('|'.join(re.escape(orig) for orig in keys)) if keys else None
+    return pattern, table, str.maketrans(single)
+
+IPA_RULES = compile_rules(IPA_REPLACEMENTS)
+RU_RULES = compile_rules(RU_REPLACEMENTS)
+NAMED_RULES = {'ipa': IPA_RULES, 'ru': RU_RULES}
+
+# Создаётся один раз; все запросы идут через его httpx-клиент (keep-alive, HTTP/2) внутри одного asyncio.run
+# raise_exception: иначе при 429 googletrans молча возвращает исходный текст вместо перевода
+translator = Translator(raise_exception=True)
+
+# Переводы хранятся между запусками; каждая пачка фиксируется сразу, так что прерванный запуск ничего не теряет.
+# База открывается при первом обращении: --help и запуски целиком из CSV файл не создают
+TRANSLATIONS_DB = "translations.sqlite"
+translation_cache: sqlite3.Connection = None
+
+def get_translation_cache() -> sqlite3.Connection:
+    global translation_cache
+    if translation_cache is None:
+        translation_cache = sqlite3.connect(TRANSLATIONS_DB)
+        translation_cache.execute("CREATE TABLE IF NOT EXISTS t(k BLOB PRIMARY KEY, v TEXT, ts INTEGER)")
+    return translation_cache
+
+def close_translation_cache():
+    global translation_cache
+    if translation_cache is not None:
+        translation_cache.close()
+        translation_cache = None
+
+# Слово из NORMALIZATION_MAP целиком, между пробелами — как и при разбиении по split()
+NORMALIZATION_RE = re.compile(r'(?<!\S)(?:' + '|'.join(map(re.escape, NORMALIZATION_MAP)) + r')(?!\S)')
 
 def normalize(phrase: str) -> str:
-    words = phrase.lower().split()
-    return ' '.join(NORMALIZATION_MAP.get(w, w) for w in words)
+    # split/join только схлопывают пробелы (на C); замены — одним проходом регулярки
+    return NORMALIZATION_RE.sub(lambda m: NORMALIZATION_MAP[m.group(0)], ' '.join(phrase.lower().split()))
 
-def apply_replacements(phrase: str, rules: List[tuple]) -> str:
-    result = phrase.lower()
-    for orig, repl in rules:
-        result = result.replace(orig, repl)
-    return result
+def apply_replacements(phrase: str, rules: tuple) -> str:
+    # На входе уже нормализованная фраза — она в нижнем регистре, повторный lower() не нужен
+    pattern, table, single = rules
+    if pattern is not None:
+        phrase = pattern.sub(lambda m: table[m.group(0)], phrase)
+    return phrase.translate(single)
+
+# Повторяющиеся фразы не транскрибируем заново; правила выбираются по имени, чтобы ключ был хэшируемым
+@lru_cache(maxsize=4096)
+def replace_by_kind(phrase: str, kind: str) -> str:
+    return apply_replacements(phrase, NAMED_RULES[kind])
+
+def translation_key(phrase: str, src='ro', dest='ru') -> bytes:
+    return hashlib.sha1(f"{src}|{dest}|{phrase}".encode("utf-8")).digest()
+
+def recall_translation(key: bytes):
+    row = get_translation_cache().execute("SELECT v FROM t WHERE k = ?", (key,)).fetchone()
+    return row[0] if row is not None else None
+
+def remember_translation(key: bytes, text: str):
+    remember_translations([(key, text)])
+
+def remember_translations(items: List[tuple]):
+    # Одна транзакция на пачку, а не коммит на каждую строку
+    now = int(time.time())
+    conn = get_translation_cache()
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO t VALUES (?, ?, ?)", [(key, text, now) for key, text in items])
+
+next_request_at = 0.0
+
+async def wait_rate_limit():
+    # Каждому запросу — своё время старта, не чаще TRANSLATE_RATE в секунду; всё в одном потоке, блокировка не нужна
+    global next_request_at
+    now = asyncio.get_running_loop().time()
+    start = max(now, next_request_at)
+    next_request_at = start + 1 / TRANSLATE_RATE
+    if start > now:
+        await asyncio.sleep(start - now)
+
+def is_retryable(error: Exception) -> bool:
+    return isinstance(error, httpx.TransportError) or bool(RETRY_STATUS_RE.search(str(error)))
+
+async def translate_with_retry(text: str, src='ro', dest='ru'):
+    for attempt in range(TRANSLATE_ATTEMPTS):
+        await wait_rate_limit()
+        try:
+            return await translator.translate(text, src=src, dest=dest)
+        except Exception as e:
+            if attempt == TRANSLATE_ATTEMPTS - 1 or not is_retryable(e):
+                raise
+        await asyncio.sleep(min(TRANSLATE_MAX_BACKOFF, 2 ** attempt))
 
 async def translate_phrase(phrase: str, src='ro', dest='ru') -> str:
+    key = translation_key(phrase, src, dest)
+    cached = recall_translation(key)
+    if cached is not None:
+        return cached
     try:
-        translation = await translator.translate(phrase, src=src, dest=dest)
-        return translation.text
+        translation = await translate_with_retry(phrase, src, dest)
     except Exception as e:
         return f"[ошибка перевода: {e}]"
+    remember_translation(key, translation.text)
+    return translation.text
+
+def split_batches(phrases: List[str], max_chars: int = TRANSLATE_BATCH_CHARS) -> List[List[str]]:
+    # Промахи CSV режутся на пачки по TRANSLATE_BATCH_CHARS вместе с переводами строк, которыми их склеит translate_batch
+    batches, size = [[]], 0
+    for phrase in phrases:
+        if batches[-1] and size + len(phrase) + 1 > max_chars:
+            batches.append([])
+            size = 0
+        batches[-1].append(phrase)
+        size += len(phrase) + 1
+    return [batch for batch in batches if batch]
 
-def speak(phrase: str, lang='ro', filename='audio'):
+async def translate_batch(phrases: List[str], src='ro', dest='ru') -> List[str]:
+    # Одна пачка — один запрос; если строки ответа не сошлись с фразами, переводим пачку по одной
+    try:
+        translation = await translate_with_retry("\n".join(phrases), src, dest)
+        lines = [line.strip() for line in translation.text.split("\n")]
+    except Exception:
+        lines = []
+    if len(lines) != len(phrases):
+        return list(await asyncio.gather(*(translate_phrase(phrase, src, dest) for phrase in phrases)))
+    remember_translations([(translation_key(phrase, src, dest), line) for phrase, line in zip(phrases, lines)])
+    return lines
+
+async def translate_many(phrases: List[str], semaphore: asyncio.Semaphore, src='ro', dest='ru') -> Dict[str, str]:
+    translations = {}
+    for phrase in dict.fromkeys(phrases):
+        cached = recall_translation(translation_key(phrase, src, dest))
+        if cached is not None:
+            translations[phrase] = cached
+
+    async def bounded(batch: List[str]) -> List[str]:
+        async with semaphore:
+            return await translate_batch(batch, src, dest)
+
+    batches = split_batches([phrase for phrase in dict.fromkeys(phrases) if phrase not in translations])
+    for batch, lines in zip(batches, await asyncio.gather(*(bounded(batch) for batch in batches))):
+        translations.update(zip(batch, lines))
+    return translations
+
+def speak_espeak(phrase: str, lang: str, filename_mp3: str):
+    # Локальный синтез без сети: espeak-ng отдаёт WAV в stdout, pydub перекодирует его в mp3
+    from pydub import AudioSegment
+    wav = subprocess.run(
+        ['espeak-ng', '--stdout', '-v', lang, '--stdin'],
+        input=phrase.encode('utf-8'), capture_output=True, check=True
+    ).stdout
+    AudioSegment.from_wav(BytesIO(wav)).export(filename_mp3, format="mp3")
+
+def speak(phrase: str, lang='ro', filename='audio', engine='gtts'):
     filename_mp3 = f"{filename}.mp3"
+    # Уже озвученное с прошлых запусков не запрашиваем повторно; пустой файл — след оборванной записи
+    if os.path.exists(filename_mp3) and os.path.getsize(filename_mp3) > 0:
+        return
+    if engine == 'espeak':
+        speak_espeak(phrase, lang, filename_mp3)
+        return
     tts = gTTS(text=phrase, lang=lang)
     tts.save(filename_mp3)
 
+async def speak_async(phrase: str, lang='ro', filename='audio', engine='gtts'):
+    # Синтез блокирующий — пока он идёт, цикл событий обслуживает переводы
+    await asyncio.get_running_loop().run_in_executor(tts_pool, speak, phrase, lang, filename, engine)
+
 def read_existing_csv(csv_path: str) -> Dict[str, dict]:
     if not os.path.exists(csv_path):
         return {}
@@ -68,31 +257,42 @@ def read_existing_csv(csv_path: str) -> Dict[str, dict]:
                 existing_data[key] = row
     return existing_data
 
-async def transcribe(phrase: str, cache: Dict[str, dict]) -> dict:
-    normalized = normalize(phrase)
-
-    if normalized in cache:
-        result = cache[normalized]
-        print(f"{result['original']} (→ {result['normalized']}):")
-        print(f"  IPA: {result['ipa']}")
-        print(f"  Рус: {result['ru_phonetic']}")
-        print(f"  Перевод: {result['translation']} ✅ (из кэша)")
-        return result
-
-    result = {
-        'original': phrase,
-        'normalized': normalized,
-        'ipa': apply_replacements(normalized, IPA_REPLACEMENTS),
-        'ru_phonetic': apply_replacements(normalized, RU_REPLACEMENTS),
-        'translation': await translate_phrase(normalized)
-    }
-    return result
+def format_cached(result: dict) -> str:
+    return (
+        f"{result['original']} (→ {result['normalized']}):\n"
+        f"  IPA: {result['ipa']}\n"
+        f"  Рус: {result['ru_phonetic']}\n"
+        f"  Перевод: {result['translation']} ✅ (из кэша)\n"
+    )
+
+async def transcribe(phrase: str, normalized: str, translations: Dict[str, str] = None) -> Transcription:
+    return Transcription(
+        original=phrase,
+        normalized=normalized,
+        ipa=replace_by_kind(normalized, 'ipa'),
+        ru_phonetic=replace_by_kind(normalized, 'ru'),
+        translation=translations[normalized] if translations and normalized in translations else await translate_phrase(normalized)
+    )
 
-async def save_to_csv(data: List[dict], filename="transcription_results.csv"):
-    with open(filename, mode="w", encoding="utf-8", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=["original", "normalized", "ipa", "ru_phonetic", "translation"])
-        writer.writeheader()
-        writer.writerows(data)
+def open_csv_writer(csv_path: str) -> tuple:
+    # Дописываем в конец: заголовок — только в новый файл, старые строки не переписываются
+    is_new = not os.path.exists(csv_path) or os.path.getsize(csv_path) == 0
+    f = open(csv_path, mode="a", encoding="utf-8", newline="")
+    writer = csv.writer(f)
+    if is_new:
+        writer.writerow(CSV_FIELDS)
+    return f, writer
+
+def audio_filename(audio_dir: str, normalized: str) -> str:
+    return os.path.join(audio_dir, normalized.replace(' ', '_'))
+
+async def process_one(phrase: str, normalized: str, translations: Dict[str, str], audio_dir: str, semaphore: asyncio.Semaphore, save_row, engine='gtts') -> Transcription:
+    async with semaphore:
+        result = await transcribe(phrase, normalized, translations)
+    save_row(result)
+    # Семафор переводов не держим на время озвучки: её ограничивает tts_pool
+    await speak_async(result.normalized, filename=audio_filename(audio_dir, result.normalized), engine=engine)
+    return result
 
 def read_phrases_from_txt(file_path: str) -> List[str]:
     if not os.path.exists(file_path):
@@ -107,6 +307,8 @@ async def main():
     parser.add_argument('--txt', help='Путь к .txt файлу с фразами')
     parser.add_argument('--csv', default='transcription_results.csv', help='Файл CSV для чтения и записи')
     parser.add_argument('--audio_dir', default='audio', help='Папка для сохранения mp3')
+    parser.add_argument('--tts-engine', choices=['gtts', 'espeak'], default='gtts', help='Озвучка: gtts (сеть, лучше качество) или espeak (локально через espeak-ng)')
+    parser.add_argument('--quiet', action='store_true', help='Не выводить найденное в кэше, только ошибки')
     args = parser.parse_args()
 
     os.makedirs(args.audio_dir, exist_ok=True)
@@ -119,22 +321,67 @@ async def main():
         print("❗ Укажите фразы через --words или --txt путь_к_файлу.txt")
         return
 
-    # Удаляем повторы
-    unique_phrases: Set[str] = set(input_items)
-
     # Загружаем кэш из CSV
     cache = read_existing_csv(args.csv)
-    results = list(cache.values())  # уже сохранённые записи
-
     normalized_in_cache = set(cache.keys())
 
-    for phrase in unique_phrases:
-        result = await transcribe(phrase, cache)
-        results.append(result)
-        speak(result['normalized'], filename=os.path.join(args.audio_dir, result['normalized'].replace(' ', '_')))
-        print()
+    # Удаляем повторы, сохраняя порядок ввода; в работу идёт только то, чего нет в кэше
+    # Вывод копится и уходит в stdout одной записью, а не print() на каждую строку
+    needed: Dict[str, str] = {}
+    cached: Dict[str, str] = {}
+    log_buf: List[str] = []
+    for phrase in dict.fromkeys(input_items):
+        normalized = normalize(phrase)
+        if normalized in normalized_in_cache:
+            if normalized not in cached and not args.quiet:
+                log_buf.append(format_cached(cache[normalized]))
+            cached.setdefault(normalized, phrase)
+        else:
+            needed.setdefault(normalized, phrase)
+    if log_buf:
+        sys.stdout.write("\n".join(log_buf) + "\n")
+        sys.stdout.flush()
+
+    # Озвучка нужна и фразам из кэша: папка могла смениться, а прошлый синтез — сорваться; готовые mp3 speak пропускает
+    audio_task = asyncio.gather(
+        *(speak_async(normalized, filename=audio_filename(args.audio_dir, normalized), engine=args.tts_engine) for normalized in cached),
+        return_exceptions=True
+    )
+
+    outcomes = []
+    if needed:
+        csv_file, writer = open_csv_writer(args.csv)
+
+        def save_row(result: Transcription):
+            # Новая строка попадает в файл сразу, как готова: прерванный запуск ничего не теряет
+            writer.writerow(astuple(result))
+            csv_file.flush()
+
+        # База переводов открывается при первом промахе; закрываем её, даже если перевод упал
+        try:
+            with csv_file:
+                # Один httpx-клиент переводчика на весь запуск: соединения переиспользуются, на выходе закрываются
+                async with translator:
+                    # Переводы для всего нового — заранее и пачками
+                    semaphore = asyncio.Semaphore(CONCURRENCY)
+                    translations = await translate_many(list(needed), semaphore)
+
+                    # Все фразы обрабатываются параллельно; gather возвращает результаты в порядке ввода
+                    outcomes = await asyncio.gather(
+                        *(process_one(phrase, normalized, translations, args.audio_dir, semaphore, save_row, args.tts_engine) for normalized, phrase in needed.items()),
+                        return_exceptions=True
+                    )
+        finally:
+            close_translation_cache()
+    audio_outcomes = await audio_task
 
-    await save_to_csv(results, filename=args.csv)
+    errors = [
+        f"❗ {phrase}: {result}\n"
+        for phrase, result in zip([*needed.values(), *cached.values()], [*outcomes, *audio_outcomes])
+        if isinstance(result, Exception)
+    ]
+    if errors:
+        sys.stdout.write("".join(errors))
 
 if __name__ == "__main__":
     asyncio.run(main())